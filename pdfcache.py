@@ -0,0 +1,356 @@
+# Copyright 2010-2013 Zack Weinberg <zackw@panix.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the Artistic License 2.0.  See the file
+# "Artistic-2.0" in the source distribution, or
+# <http://www.opensource.org/licenses/artistic-license-2.0.php>, for
+# further details.
+
+# Binary cache for parsed content streams.  Tokenizing a content
+# stream with ContentParser is slow, and the same streams get
+# re-optimized over and over with different settings, so we save the
+# parsed object sequence in a compact binary form that can be read
+# back far faster than the text can be reparsed.
+#
+# The encoding is:
+#
+#    magic    b'PDFc'
+#    version  one byte, currently 2
+#    parser   varint, the pdfcontent.PARSER_VERSION that produced it
+#    table    varint count, then for each entry a kind byte (N for
+#             Name, O for Operator) and a length-prefixed byte string
+#    objects  a sequence of tagged values
+#    digest   16-byte BLAKE2b digest of everything before it
+#
+# Each value is a one-byte tag followed by its payload:
+#
+#    NULL, FALSE, TRUE     no payload
+#    INT                   zigzag varint
+#    FLOAT                 8-byte little-endian IEEE double
+#    STRING                varint length, then the bytes
+#    ID                    varint index into the table
+#    ARRAY, CARRAY         the elements, then END
+#    DICT, IIDICT          alternating keys and values, then END
+#
+# Varints are little-endian base-128, high bit set on all but the
+# last byte.  The digest lets us detect a truncated or damaged entry,
+# which might otherwise decode as a shorter but valid stream.
+
+import hashlib
+import os
+import struct
+import tempfile
+import time
+
+from pdfcontent import (ContentParser, PARSER_VERSION, Name, Operator,
+                        Array, CArray, Dict, IIDict)
+
+class CacheError(Exception): pass
+
+_magic = b'PDFc'
+_version = 2
+_digest_size = 16
+
+(_NULL, _FALSE, _TRUE, _INT, _FLOAT, _STRING, _ID,
+ _ARRAY, _CARRAY, _DICT, _IIDICT, _END) = range(12)
+
+_containers = ((Array, _ARRAY), (CArray, _CARRAY),
+               (IIDict, _IIDICT), (Dict, _DICT))
+_kinds = { Name: b'N', Operator: b'O' }
+_kind_classes = { ord(b'N'): Name, ord(b'O'): Operator }
+
+_double = struct.Struct('<d')
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=_digest_size).digest()
+
+def _put_varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def dump(objects):
+    """Encode the iterable of content-stream OBJECTS, as produced by
+    ContentParser, into the cache format.  Returns bytes."""
+    table = {}
+    body = bytearray()
+
+    def put(obj):
+        if obj is None:
+            body.append(_NULL)
+        elif obj is False:
+            body.append(_FALSE)
+        elif obj is True:
+            body.append(_TRUE)
+        elif isinstance(obj, int):
+            body.append(_INT)
+            _put_varint(body, obj << 1 if obj >= 0 else (~obj << 1) | 1)
+        elif isinstance(obj, float):
+            body.append(_FLOAT)
+            body.extend(_double.pack(obj))
+        elif type(obj) in _kinds:
+            # Name and Operator compare equal to each other when
+            # spelled the same, so the kind must be part of the key.
+            key = (type(obj), obj)
+            index = table.get(key)
+            if index is None:
+                index = table[key] = len(table)
+            body.append(_ID)
+            _put_varint(body, index)
+        elif isinstance(obj, bytes):
+            body.append(_STRING)
+            _put_varint(body, len(obj))
+            body.extend(obj)
+        else:
+            for cls, tag in _containers:
+                if isinstance(obj, cls):
+                    break
+            else:
+                raise TypeError("cannot encode {!r} in a content cache"
+                                .format(obj))
+            body.append(tag)
+            if isinstance(obj, dict):
+                for k, v in obj.items():
+                    put(k)
+                    put(v)
+            else:
+                for x in obj:
+                    put(x)
+            body.append(_END)
+
+    for obj in objects:
+        put(obj)
+
+    out = bytearray(_magic)
+    out.append(_version)
+    _put_varint(out, PARSER_VERSION)
+    _put_varint(out, len(table))
+    for cls, text in table:
+        out += _kinds[cls]
+        _put_varint(out, len(text))
+        out += text
+    out += body
+    out += _digest(out)
+    return bytes(out)
+
+def load(data):
+    """Decode DATA, as produced by dump(), back into a list of
+    content-stream objects identical to those originally encoded.
+    Raises CacheError if DATA is not in the current cache format."""
+    if data[:4] != _magic or len(data) < 5:
+        raise CacheError("not a content cache")
+    if data[4] != _version:
+        raise CacheError("unsupported content cache version {}"
+                         .format(data[4]))
+    end = len(data) - _digest_size
+    if end < 5 or _digest(data[:end]) != data[end:]:
+        raise CacheError("truncated or corrupt content cache")
+    unpack_double = _double.unpack_from
+    pos = 5
+
+    try:
+        n = 0
+        shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            shift += 7
+            if b < 0x80: break
+        if n != PARSER_VERSION:
+            raise CacheError("content cache made by parser version {}"
+                             .format(n))
+
+        # The table.  Constructing each Id goes through the intern
+        # table, so the objects we hand back are the very same ones a
+        # fresh parse would produce.
+        n = 0
+        shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            shift += 7
+            if b < 0x80: break
+        table = []
+        for _ in range(n):
+            cls = _kind_classes[data[pos]]
+            pos += 1
+            length = 0
+            shift = 0
+            while True:
+                b = data[pos]
+                pos += 1
+                length |= (b & 0x7F) << shift
+                shift += 7
+                if b < 0x80: break
+            if pos + length > end: raise IndexError
+            table.append(cls(data[pos:pos+length]))
+            pos += length
+
+        # The objects.  Containers under construction are kept on a
+        # stack as (tag, items) pairs; dicts collect alternating keys
+        # and values, and are built when they are closed.
+        out = []
+        items = out
+        stack = []
+        while pos < end:
+            tag = data[pos]
+            pos += 1
+            if tag == _INT or tag == _ID or tag == _STRING:
+                n = 0
+                shift = 0
+                while True:
+                    b = data[pos]
+                    pos += 1
+                    n |= (b & 0x7F) << shift
+                    shift += 7
+                    if b < 0x80: break
+                if tag == _INT:
+                    items.append(n >> 1 if not n & 1 else ~(n >> 1))
+                elif tag == _ID:
+                    items.append(table[n])
+                else:
+                    if pos + n > end: raise IndexError
+                    items.append(data[pos:pos+n])
+                    pos += n
+            elif tag == _FLOAT:
+                if pos + 8 > end: raise IndexError
+                items.append(unpack_double(data, pos)[0])
+                pos += 8
+            elif tag == _NULL:
+                items.append(None)
+            elif tag == _FALSE:
+                items.append(False)
+            elif tag == _TRUE:
+                items.append(True)
+            elif _ARRAY <= tag <= _IIDICT:
+                stack.append((tag, items))
+                items = []
+            elif tag == _END:
+                tag, parent = stack.pop()
+                if tag == _ARRAY:
+                    obj = Array(items)
+                elif tag == _CARRAY:
+                    obj = CArray(items)
+                else:
+                    if len(items) % 2:
+                        raise CacheError("dictionary key with no value")
+                    if not all(type(k) is Name for k in items[::2]):
+                        raise CacheError("dictionary key is not a name")
+                    it = iter(items)
+                    obj = (Dict if tag == _DICT else IIDict)(zip(it, it))
+                parent.append(obj)
+                items = parent
+            else:
+                raise CacheError("invalid tag {} at offset {}"
+                                 .format(tag, pos - 1))
+    except (IndexError, KeyError, struct.error):
+        raise CacheError("truncated or corrupt content cache")
+
+    if stack or pos != end:
+        raise CacheError("truncated or corrupt content cache")
+    return out
+
+class ContentCache(object):
+    """An on-disk cache of parsed content streams, kept in DIRECTORY
+    and keyed by a hash of the raw stream contents.  When the total
+    size of the cache exceeds MAX_SIZE bytes, the least recently used
+    entries are discarded until it is down to LOW_WATER times that, so
+    that the directory need not be rescanned on every store."""
+
+    suffix = '.pdfc'
+    tmp_suffix = '.tmp'
+
+    # Temporary files older than this many seconds were left behind by
+    # an interrupted write, and are deleted.
+    stale_tmp_age = 3600
+
+    def __init__(self, directory, max_size=64*1024*1024, low_water=0.75):
+        self.directory = directory
+        self.max_size = max_size
+        self.low_water = low_water
+        os.makedirs(directory, exist_ok=True)
+        # Our running estimate of the size of the directory.  Other
+        # processes may be using it too, so evict() recomputes it.
+        self.size = 0
+        self.evict()
+
+    def path(self, data):
+        """The file in which the parse of DATA is cached."""
+        return os.path.join(self.directory,
+                            hashlib.sha256(data).hexdigest() + self.suffix)
+
+    def parse(self, data):
+        """Return the list of objects in the content stream DATA,
+        from the cache if possible, otherwise by parsing it (and
+        caching the result)."""
+        path = self.path(data)
+        try:
+            with open(path, 'rb') as f:
+                objects = load(f.read())
+            os.utime(path)
+            return objects
+        except FileNotFoundError:
+            pass
+        except CacheError:
+            # Stale or damaged; it will be overwritten below.
+            pass
+
+        objects = list(ContentParser(bytes((c,)) for c in data))
+        self.store(path, dump(objects))
+        return objects
+
+    def store(self, path, encoded):
+        # Write to a temporary file and rename, so that a concurrent
+        # reader never sees a partial entry.
+        try:
+            self.size -= os.stat(path).st_size
+        except FileNotFoundError:
+            pass
+        fd, tmp = tempfile.mkstemp(dir=self.directory,
+                                   suffix=self.tmp_suffix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(encoded)
+            os.replace(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+        self.size += len(encoded)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Recompute the size of the cache, deleting stale temporary
+        files.  If it is bigger than max_size, discard least recently
+        used entries until it is no bigger than low_water * max_size."""
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            is_tmp = entry.name.endswith(self.tmp_suffix)
+            if not is_tmp and not entry.name.endswith(self.suffix):
+                continue
+            try:
+                st = entry.stat()
+                if is_tmp and now - st.st_mtime > self.stale_tmp_age:
+                    os.unlink(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            total += st.st_size
+            if not is_tmp:
+                entries.append((st.st_mtime, st.st_size, entry.path))
+
+        if total > self.max_size:
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.max_size * self.low_water: break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self.size = total
@@ -217,6 +217,10 @@ _image_end = Operator(b'EI')
 # All PDF numbers match this regular expression.
 _number_r = re.compile(br'^[+-]?(?:[0-9]+\.?|[0-9]*\.[0-9]+)$')
 
+# Bump this whenever ContentParser's output for some input changes,
+# so that anything saved from an older parse is discarded.
+PARSER_VERSION = 1
+
 class ContentParser(object):
     """A ContentParser is an iterator over an object which, when
     itself iterated, yields single bytes.  The ContentParser yields
@@ -236,7 +240,7 @@ class ContentParser(object):
         c = next(p)
 
         if c == b'/': return self.parse_name_literal()
-        if c == b'(': return self.parse_paren_string()
+        if c == b'(': return self.parse_string()
         if c == b'[': return self.parse_array(False)
         if c == b'{': return self.parse_array(True)
 
@@ -351,7 +355,7 @@ class ContentParser(object):
                                 n = n * 8 + (ord(c) - ord('0'))
                                 c = next(p)
                         p.pushback(c)
-                        c = chr(n)
+                        c = bytes((n,))
                     elif c == b'\n':
                         continue # backslash-newline is eaten
                     elif c == b'\r':
@@ -398,7 +402,7 @@ class ContentParser(object):
                       item == _image_data):
                     raise PDFSyntaxError("stray inline image operator")
                 else:
-                    rv.push(item)
+                    rv.append(item)
 
         except StopIteration:
             raise PDFSyntaxError("EOF inside an array")
@@ -0,0 +1,789 @@
+# Copyright 2010-2013 Zack Weinberg <zackw@panix.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the Artistic License 2.0.  See the file
+# "Artistic-2.0" in the source distribution, or
+# <http://www.opensource.org/licenses/artistic-license-2.0.php>, for
+# further details.
+
+# Culling of invisible content.  Many PDF generators draw a great deal
+# of material that can never be seen: objects entirely off the page,
+# objects inside a clipping region that excludes them, white fills on
+# the blank page, paths with no area.  Renderers still have to process
+# all of it.  This pass walks a parsed content stream (as produced by
+# pdfcontent.ContentParser), tracking the CTM, the clip, and enough of
+# the rest of the graphics state to compute a conservative bounding
+# box for each painting operation, and drops the operations which
+# provably cannot change any pixel.
+#
+# All bounding boxes are tracked in default user space (the coordinate
+# system of the page's MediaBox) as (x0, y0, x1, y1) tuples with
+# x0 <= x1 and y0 <= y1.  Every estimate errs on the side of being too
+# big: the clip we track is a superset of the true clip, and the box
+# we compute for an object is a superset of the area it paints.  Boxes
+# that merely touch are considered to intersect.
+
+import copy
+import math
+
+from pdfcontent import PDFSyntaxError, Name, Operator
+
+_inf = float('inf')
+_infinite = (-_inf, -_inf, _inf, _inf)
+
+# The bounding box of an image XObject in the coordinate system current
+# at the point where it is painted.
+UNIT_SQUARE = (0, 0, 1, 1)
+
+# Rectangle and matrix utilities.  Matrices are 6-tuples in PDF order,
+# [a b c d e f], mapping (x, y) to (ax + cy + e, bx + dy + f).
+
+_identity = (1, 0, 0, 1, 0, 0)
+
+def _mmul(m, n):
+    """Return the matrix which applies M and then N."""
+    return (m[0]*n[0] + m[1]*n[2],
+            m[0]*n[1] + m[1]*n[3],
+            m[2]*n[0] + m[3]*n[2],
+            m[2]*n[1] + m[3]*n[3],
+            m[4]*n[0] + m[5]*n[2] + n[4],
+            m[4]*n[1] + m[5]*n[3] + n[5])
+
+def _transform_rect(m, r):
+    """Return the bounding box of rectangle R transformed by matrix M."""
+    if r == _infinite or any(math.isinf(v) for v in r):
+        return _infinite
+    xs = []
+    ys = []
+    for x in (r[0], r[2]):
+        for y in (r[1], r[3]):
+            xs.append(m[0]*x + m[2]*y + m[4])
+            ys.append(m[1]*x + m[3]*y + m[5])
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def _intersect(r, s):
+    """Return the intersection of rectangles R and S, or None if they
+    are disjoint.  S may be None, in which case so is the result."""
+    if s is None: return None
+    x0 = max(r[0], s[0])
+    y0 = max(r[1], s[1])
+    x1 = min(r[2], s[2])
+    y1 = min(r[3], s[3])
+    if x0 > x1 or y0 > y1: return None
+    return (x0, y0, x1, y1)
+
+def _expand(r, d):
+    return (r[0] - d, r[1] - d, r[2] + d, r[3] + d)
+
+def _normalize_rect(r):
+    x0, y0, x1, y1 = r
+    return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+def _collinear(points):
+    """True if all of POINTS lie on a single line.  Since a Bezier
+    curve lies within the convex hull of its control points, a path
+    all of whose points and control points are collinear encloses
+    no area."""
+    x0, y0 = points[0]
+    dx = dy = 0
+    for x, y in points[1:]:
+        if dx == 0 and dy == 0:
+            dx = x - x0
+            dy = y - y0
+        elif dx * (y - y0) != dy * (x - x0):
+            return False
+    return True
+
+def _numbers(op, args, n):
+    """Check that instruction OP has exactly N numeric operands."""
+    if len(args) != n or not all(isinstance(a, (int, float)) and
+                                 not isinstance(a, bool) for a in args):
+        raise PDFSyntaxError("operator {!a} requires {} numeric operands"
+                             .format(bytes(op), n))
+    return args
+
+# Font metrics.  Without access to the font program we cannot know how
+# big any glyph is, so the caller may describe each font (keyed by its
+# resource name, as used with Tf) by the union of its glyph bounding
+# boxes and its largest advance width, both in text space for a font
+# size of 1.  Text in fonts not described is assumed to paint anywhere
+# within the clip.  DEFAULT_FONT is generous enough for ordinary Latin
+# text fonts, but it is a guess, not a bound, so callers must ask for
+# it explicitly.  Vertical writing is not modeled; describe vertical
+# fonts with a box covering the whole run.
+
+class FontMetrics(object):
+    """Conservative metrics for one font: BBOX is a rectangle which
+    contains every glyph drawn at the origin, MAX_ADVANCE is the
+    largest horizontal advance of any glyph."""
+    def __init__(self, bbox, max_advance):
+        self.bbox = _normalize_rect(bbox)
+        self.max_advance = max_advance
+
+    def __repr__(self):
+        return "FontMetrics({!r}, {!r})".format(self.bbox, self.max_advance)
+
+DEFAULT_FONT = FontMetrics((-1, -1, 2, 2), 2)
+
+# Operator tables.
+
+def _ops(*names):
+    return frozenset(Operator(n) for n in names)
+
+_path_construction = _ops(b'm', b'l', b'c', b'v', b'y', b'h', b're')
+_path_clip = _ops(b'W', b'W*')
+
+# painting operator -> (fills, strokes)
+_path_paint = {
+    Operator(b'S'):  (False, True),
+    Operator(b's'):  (False, True),
+    Operator(b'f'):  (True,  False),
+    Operator(b'F'):  (True,  False),
+    Operator(b'f*'): (True,  False),
+    Operator(b'B'):  (True,  True),
+    Operator(b'B*'): (True,  True),
+    Operator(b'b'):  (True,  True),
+    Operator(b'b*'): (True,  True),
+    Operator(b'n'):  (False, False),
+}
+
+_text_show = _ops(b'Tj', b'TJ', b"'", b'"')
+_text_position = _ops(b'Td', b'TD', b'Tm', b'T*')
+
+# Operators which change nothing we track, and paint nothing.
+_inert = _ops(b'J', b'j', b'd', b'ri', b'i',
+              b'BMC', b'BDC', b'EMC', b'MP', b'DP', b'BX', b'EX',
+              b'd0', b'd1')
+
+_q = Operator(b'q')
+_Q = Operator(b'Q')
+_BT = Operator(b'BT')
+_ET = Operator(b'ET')
+_Tstar = Operator(b'T*')
+_Tc = Operator(b'Tc')
+_Tw = Operator(b'Tw')
+_TL = Operator(b'TL')
+
+# Color spaces in which we can recognize white.
+_DeviceGray = Name(b'DeviceGray')
+_DeviceRGB = Name(b'DeviceRGB')
+_DeviceCMYK = Name(b'DeviceCMYK')
+_white = {
+    _DeviceGray: [1],
+    _DeviceRGB: [1, 1, 1],
+    _DeviceCMYK: [0, 0, 0, 0],
+}
+_initial_color = {
+    _DeviceGray: [0],
+    _DeviceRGB: [0, 0, 0],
+    _DeviceCMYK: [0, 0, 0, 1],
+}
+
+class _GState(object):
+    """The subset of the graphics state that affects culling."""
+    def __init__(self, clip):
+        self.ctm = _identity
+        self.clip = clip
+        self.line_width = 1
+        self.miter_limit = 10
+        self.fill_space = _DeviceGray
+        self.fill_color = [0]
+        self.stroke_space = _DeviceGray
+        self.stroke_color = [0]
+        # Cleared by 'gs', since an ExtGState may select transparency
+        # or a blend mode under which white is not invisible.
+        self.opaque = True
+        self.font = None
+        self.font_size = None
+        self.char_spacing = 0
+        self.word_spacing = 0
+        self.hscale = 100
+        self.leading = 0
+        self.render_mode = 0
+        self.rise = 0
+
+    def copy(self):
+        return copy.copy(self)
+
+class Culler(object):
+    """A Culler removes content-stream instructions which provably
+    cannot change any pixel of the rendered page.
+
+    MEDIABOX and CROPBOX are the page's boxes as (x0, y0, x1, y1).
+    XOBJECTS maps XObject resource names to their bounding box in the
+    coordinate system current where they are painted with Do: for an
+    image this is UNIT_SQUARE, for a form it is its /BBox transformed
+    by its /Matrix.  FONTS maps font resource names to FontMetrics;
+    fonts not listed use the metrics passed as the default_font
+    argument, if any (pdfcull.DEFAULT_FONT suits ordinary Latin text),
+    and are otherwise treated as unbounded.  XObjects not listed, and
+    shadings, are likewise assumed to cover the entire clip.
+
+    Invisible text (rendering mode 3) is usually a scanned page's OCR
+    layer, needed for searching, copying and accessibility, so it is
+    only removed if DROP_INVISIBLE_TEXT is true.
+
+    The page is assumed to be rendered onto a white background, as
+    page content is; do not use the 'white-on-white' rule for forms
+    or annotation appearances."""
+
+    # Rules, in the order they are checked.
+    rules = ('no-paint', 'zero-area', 'invisible-text', 'empty-clip',
+             'outside-page', 'clipped-out', 'white-on-white')
+
+    def __init__(self, mediabox, cropbox=None, xobjects=None, fonts=None,
+                 default_font=None, drop_invisible_text=False):
+        page = _normalize_rect(mediabox)
+        if cropbox is not None:
+            page = _intersect(page, _normalize_rect(cropbox))
+        self.page = page
+        self.xobjects = xobjects or {}
+        self.fonts = fonts or {}
+        self.default_font = default_font
+        self.drop_invisible_text = drop_invisible_text
+
+    def cull(self, objects):
+        """Cull the iterable of content-stream OBJECTS.  Returns a pair
+        (kept, removed): KEPT is a list of the objects that remain,
+        REMOVED a list of (rule, objects) pairs, in stream order, for
+        each instruction or group of instructions taken out."""
+        self._kept = []
+        self._removed = []
+        self._gs = _GState(self.page)
+        self._stack = []
+        self._painted = [[] for _ in range(self.grid * self.grid)]
+        self._painted_everywhere = False
+        self._path = None
+        self._text = None
+        self._bare_clip = False
+
+        operands = []
+        for obj in objects:
+            if isinstance(obj, Operator):
+                self._instruction(operands, obj)
+                operands = []
+            else:
+                operands.append(obj)
+        if operands:
+            raise PDFSyntaxError("operands at end of stream with no operator")
+
+        # Tolerate a truncated stream.
+        if self._path is not None:
+            self._flush_path()
+        if self._text is not None:
+            self._end_text()
+        return self._kept, self._removed
+
+    # Bookkeeping.
+
+    def _classify(self, bbox, colors=()):
+        """Decide whether an object painting BBOX (in user space) with
+        COLORS (pairs of color space and color) is invisible.  Returns
+        the rule that applies, or None, in which case the object is
+        recorded as painted."""
+        gs = self._gs
+        if gs.clip is None:
+            return 'empty-clip'
+        page_bbox = _transform_rect(gs.ctm, bbox)
+        if _intersect(page_bbox, self.page) is None:
+            return 'outside-page'
+        visible = _intersect(page_bbox, gs.clip)
+        if visible is None:
+            return 'clipped-out'
+        if (colors and gs.opaque and
+            all(_white.get(space) == color for space, color in colors) and
+            not self._overlaps_painted(visible)):
+            return 'white-on-white'
+        self._paint(visible)
+        return None
+
+    # Painted areas are recorded in a grid of buckets over the page, so
+    # that checking for overlap does not mean comparing against every
+    # rectangle painted so far.  A rectangle goes into every bucket it
+    # touches; since the bucket index is a monotonic function of the
+    # coordinates, two rectangles that share a point share a bucket.
+    # A bucket that gets too crowded is replaced by the union of its
+    # rectangles, clipped to the bucket, which can only overestimate.
+
+    grid = 32
+    bucket_limit = 16
+
+    def _cells(self, r):
+        page = self.page
+        cw = (page[2] - page[0]) / self.grid or 1
+        ch = (page[3] - page[1]) / self.grid or 1
+        last = self.grid - 1
+        def cell(v, origin, size):
+            return min(last, max(0, int(math.floor((v - origin) / size))))
+        x0 = cell(r[0], page[0], cw)
+        x1 = cell(r[2], page[0], cw)
+        y0 = cell(r[1], page[1], ch)
+        y1 = cell(r[3], page[1], ch)
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                yield y * self.grid + x, (page[0] + x * cw, page[1] + y * ch,
+                                          page[0] + (x+1) * cw,
+                                          page[1] + (y+1) * ch)
+
+    def _overlaps_painted(self, r):
+        if self._painted_everywhere: return True
+        for i, cell in self._cells(r):
+            for p in self._painted[i]:
+                if _intersect(r, p) is not None:
+                    return True
+        return False
+
+    def _paint(self, r):
+        if r is None or self._painted_everywhere: return
+        if r == _infinite or any(math.isinf(v) for v in r):
+            self._painted_everywhere = True
+            return
+        for i, cell in self._cells(r):
+            if (r[0] <= cell[0] and r[1] <= cell[1] and
+                r[2] >= cell[2] and r[3] >= cell[3]):
+                self._painted[i] = [cell]
+                continue
+            bucket = self._painted[i]
+            bucket.append(r)
+            if len(bucket) > self.bucket_limit:
+                union = (min(p[0] for p in bucket), min(p[1] for p in bucket),
+                         max(p[2] for p in bucket), max(p[3] for p in bucket))
+                self._painted[i] = [_intersect(union, cell) or union]
+
+    def _paint_unknown(self):
+        self._painted_everywhere = True
+
+    def _stroke_expand(self, bbox):
+        # The stroke lies within the path dilated by half the line
+        # width, except at miter joins (at most miter_limit times that)
+        # and projecting caps (at most sqrt(2) times that).
+        gs = self._gs
+        w = abs(gs.line_width) / 2
+        return _expand(bbox, w * max(gs.miter_limit, math.sqrt(2)))
+
+    # Instruction dispatch.
+
+    def _instruction(self, args, op):
+        if self._path is not None:
+            if op in _path_construction or op in _path_clip:
+                self._path_op(args, op)
+                return
+            if op in _path_paint:
+                self._paint_path(args, op)
+                return
+            # Malformed: the path was never painted.  Keep it as is.
+            self._flush_path()
+
+        if self._text is not None:
+            if op in _text_show:
+                self._show_text(args, op)
+                return
+            if op in _text_position:
+                self._position_text(args, op)
+                return
+            if op is _ET:
+                self._end_text(args + [op])
+                return
+
+        gs = self._gs
+        if op in _path_construction:
+            # A stray W before the path still applies to it.
+            self._path = {'objs': [], 'points': [], 'clip': self._bare_clip,
+                          'current': None, 'start': None}
+            self._bare_clip = False
+            self._path_op(args, op)
+            return
+        if op in _path_clip:
+            # W with no path is left alone, along with the painting
+            # operator that completes it, since it is not clear what
+            # it does; dropping only one of them would make the clip
+            # apply to the next path instead.
+            self._bare_clip = True
+            self._emit(args + [op])
+            return
+        if op in _path_paint:
+            if self._bare_clip:
+                self._bare_clip = False
+                self._emit(args + [op])
+                return
+            # Painting an empty path does nothing.
+            self._removed.append(('no-paint', args + [op]))
+            return
+
+        if op is _BT:
+            # Malformed: the previous text object was never ended.
+            # Keep it as is.
+            if self._text is not None:
+                self._end_text()
+            self._text = {'objs': [(args + [op], _BT)], 'removed': [],
+                          'pending': None, 'shows': 0, 'kept_shows': 0,
+                          'tlm': _identity, 'pen': (0, 0)}
+            return
+
+        if op is _q:
+            self._stack.append(gs.copy())
+        elif op is _Q:
+            # An unbalanced Q is a common error, which viewers ignore.
+            if self._stack:
+                self._gs = self._stack.pop()
+        elif op == b'cm':
+            gs.ctm = _mmul(tuple(_numbers(op, args, 6)), gs.ctm)
+        elif op == b'w':
+            gs.line_width = _numbers(op, args, 1)[0]
+        elif op == b'M':
+            gs.miter_limit = _numbers(op, args, 1)[0]
+        elif op == b'gs':
+            gs.opaque = False
+        elif op in (b'g', b'rg', b'k', b'G', b'RG', b'K'):
+            n = {b'g': 1, b'rg': 3, b'k': 4}[op.lower()]
+            space = {1: _DeviceGray, 3: _DeviceRGB, 4: _DeviceCMYK}[n]
+            color = list(_numbers(op, args, n))
+            if op.islower():
+                gs.fill_space, gs.fill_color = space, color
+            else:
+                gs.stroke_space, gs.stroke_color = space, color
+        elif op in (b'cs', b'CS'):
+            if len(args) != 1 or not isinstance(args[0], Name):
+                raise PDFSyntaxError("operator {!a} requires a name operand"
+                                     .format(bytes(op)))
+            color = list(_initial_color.get(args[0], []))
+            if op == b'cs':
+                gs.fill_space, gs.fill_color = args[0], color
+            else:
+                gs.stroke_space, gs.stroke_color = args[0], color
+        elif op in (b'sc', b'scn'):
+            gs.fill_color = list(args)
+        elif op in (b'SC', b'SCN'):
+            gs.stroke_color = list(args)
+        elif op == b'Tf':
+            if (len(args) != 2 or not isinstance(args[0], Name) or
+                not isinstance(args[1], (int, float))):
+                raise PDFSyntaxError("operator 'Tf' requires a name and "
+                                     "a size")
+            gs.font, gs.font_size = args
+        elif op == b'Tc':
+            gs.char_spacing = _numbers(op, args, 1)[0]
+        elif op == b'Tw':
+            gs.word_spacing = _numbers(op, args, 1)[0]
+        elif op == b'Tz':
+            gs.hscale = _numbers(op, args, 1)[0]
+        elif op == b'TL':
+            gs.leading = _numbers(op, args, 1)[0]
+        elif op == b'Tr':
+            gs.render_mode = _numbers(op, args, 1)[0]
+        elif op == b'Ts':
+            gs.rise = _numbers(op, args, 1)[0]
+        elif op == b'Do':
+            if len(args) != 1 or not isinstance(args[0], Name):
+                raise PDFSyntaxError("operator 'Do' requires a name operand")
+            bbox = self.xobjects.get(args[0], _infinite)
+            if self._cull(args + [op], _normalize_rect(bbox)):
+                return
+        elif op == b'sh':
+            if self._cull(args + [op], _infinite):
+                return
+        elif op not in _inert:
+            # Anything we don't understand might paint anywhere.
+            self._paint_unknown()
+
+        self._emit(args + [op])
+
+    def _emit(self, objs):
+        if self._text is not None:
+            self._text['objs'].append((objs, None))
+        else:
+            self._kept.extend(objs)
+
+    def _cull(self, objs, bbox, colors=()):
+        rule = self._classify(bbox, colors)
+        if rule is None:
+            return False
+        self._removed.append((rule, objs))
+        return True
+
+    # Paths.
+
+    def _path_op(self, args, op):
+        path = self._path
+        path['objs'].extend(args)
+        path['objs'].append(op)
+        pts = path['points']
+
+        if op in _path_clip:
+            path['clip'] = True
+            return
+        if op == b'h':
+            path['current'] = path['start']
+            return
+
+        if op == b're':
+            x, y, w, h = _numbers(op, args, 4)
+            pts.extend([(x, y), (x+w, y), (x+w, y+h), (x, y+h)])
+            path['current'] = path['start'] = (x, y)
+            return
+
+        n = {b'm': 2, b'l': 2, b'c': 6, b'v': 4, b'y': 4}[op]
+        args = _numbers(op, args, n)
+        new = [(args[i], args[i+1]) for i in range(0, n, 2)]
+        if op == b'm':
+            path['start'] = new[0]
+        elif path['current'] is None:
+            raise PDFSyntaxError("path operator {!a} with no current point"
+                                 .format(bytes(op)))
+        elif op == b'v':
+            # The first control point is the current point, which is
+            # already in the list.
+            pass
+        pts.extend(new)
+        path['current'] = new[-1]
+
+    def _flush_path(self):
+        self._paint_unknown()
+        self._emit(self._path['objs'])
+        self._path = None
+
+    def _paint_path(self, args, op):
+        path = self._path
+        self._path = None
+        objs = path['objs'] + args + [op]
+        fills, strokes = _path_paint[op]
+        gs = self._gs
+
+        if not path['points']:
+            # Only 'h' operators; there is nothing to paint.
+            if path['clip']:
+                self._emit(objs)
+            else:
+                self._removed.append(('no-paint', objs))
+            return
+        xs = [p[0] for p in path['points']]
+        ys = [p[1] for p in path['points']]
+        bbox = (min(xs), min(ys), max(xs), max(ys))
+
+        if path['clip']:
+            # Clipping paths are never removed.  The new clip is within
+            # the path, hence within its bounding box.
+            if strokes:
+                self._classify(self._stroke_expand(bbox))
+            elif fills:
+                self._classify(bbox)
+            if gs.clip is not None:
+                gs.clip = _intersect(_transform_rect(gs.ctm, bbox), gs.clip)
+            self._emit(objs)
+            return
+
+        if not fills and not strokes:
+            self._removed.append(('no-paint', objs))
+            return
+        if not strokes and _collinear(path['points']):
+            self._removed.append(('zero-area', objs))
+            return
+
+        colors = []
+        if fills:
+            colors.append((gs.fill_space, gs.fill_color))
+        if strokes:
+            colors.append((gs.stroke_space, gs.stroke_color))
+            bbox = self._stroke_expand(bbox)
+        if not self._cull(objs, bbox, colors):
+            self._emit(objs)
+
+    # Text.  Text objects are buffered from BT to ET, because removing
+    # a string-showing instruction moves every later glyph on the same
+    # line, and so can only be done if there is no further show before
+    # the next explicit positioning instruction.  If every show in the
+    # text object goes, the BT, ET and positioning instructions can go
+    # too; text state set inside the object persists after ET and is
+    # kept.
+
+    def _position_text(self, args, op):
+        text = self._text
+        gs = self._gs
+        if op == b'Tm':
+            text['tlm'] = tuple(_numbers(op, args, 6))
+        else:
+            if op == b'T*':
+                _numbers(op, args, 0)
+                tx, ty = 0, -gs.leading
+            else:
+                tx, ty = _numbers(op, args, 2)
+                if op == b'TD':
+                    gs.leading = -ty
+            text['tlm'] = _mmul((1, 0, 0, 1, tx, ty), text['tlm'])
+        self._reset_pen()
+        text['objs'].append((args + [op], op))
+
+    def _reset_pen(self):
+        text = self._text
+        text['pen'] = (0, 0)
+        if text['pending'] is not None:
+            text['removed'].append(text['pending'][1:3])
+            text['pending'] = None
+
+    def _show_text(self, args, op):
+        text = self._text
+        gs = self._gs
+        objs = args + [op]
+        replacement = []
+
+        if op == b'"':
+            if len(args) != 3:
+                raise PDFSyntaxError("operator '\"' requires 3 operands")
+            aw, ac = _numbers(op, args[:2], 2)
+            gs.word_spacing = aw
+            gs.char_spacing = ac
+            replacement = [([aw, _Tw], _Tw), ([ac, _Tc], _Tc)]
+        if op in (b'"', b"'"):
+            text['tlm'] = _mmul((1, 0, 0, 1, 0, -gs.leading), text['tlm'])
+            self._reset_pen()
+            replacement.append(([_Tstar], _Tstar))
+
+        if op == b'TJ':
+            if len(args) != 1 or not isinstance(args[0], list):
+                raise PDFSyntaxError("operator 'TJ' requires an array")
+            items = args[0]
+        else:
+            if len(args) < 1 or not isinstance(args[-1], bytes):
+                raise PDFSyntaxError("operator {!a} requires a string"
+                                     .format(bytes(op)))
+            items = [args[-1]]
+
+        # A pending culled show with no intervening repositioning has
+        # to stay after all.
+        pending = text['pending']
+        if pending is not None:
+            text['pending'] = None
+            idx, rule, pobjs, pbbox = pending
+            text['objs'][idx] = (pobjs, None)
+            text['kept_shows'] += 1
+            self._paint(pbbox)
+
+        bbox = self._text_bbox(items)
+        text['shows'] += 1
+        mode = gs.render_mode
+        if bbox is None:
+            rule = 'no-paint'
+        elif mode >= 4:
+            # Text clipping modes are never removed.
+            rule = None
+            if mode != 7:
+                self._classify(bbox)
+        elif mode == 3:
+            rule = 'invisible-text' if self.drop_invisible_text else None
+        else:
+            colors = []
+            if mode in (0, 2):
+                colors.append((gs.fill_space, gs.fill_color))
+            if mode in (1, 2):
+                colors.append((gs.stroke_space, gs.stroke_color))
+                bbox = self._stroke_expand(bbox)
+            rule = self._classify(bbox, colors)
+
+        if rule is None:
+            text['objs'].append((objs, None))
+            text['kept_shows'] += 1
+        else:
+            # Should the show have to stay, it paints within this box.
+            pbbox = None
+            if bbox is not None:
+                pbbox = _intersect(_transform_rect(gs.ctm, bbox), gs.clip)
+            text['pending'] = (len(text['objs']), rule, objs, pbbox)
+            text['objs'].append(('replace', replacement))
+
+    def _text_bbox(self, items):
+        """Compute the user-space bounding box of the glyphs shown by
+        ITEMS (strings and TJ adjustments), and advance the pen.
+        Returns None if no glyphs are shown."""
+        text = self._text
+        gs = self._gs
+        font = self.fonts.get(gs.font, self.default_font)
+        if gs.font_size is None:
+            raise PDFSyntaxError("text shown with no font selected")
+        if font is None:
+            # Anything could happen; the pen could end up anywhere.
+            text['pen'] = (-_inf, _inf)
+            shown = False
+            for item in items:
+                if isinstance(item, bytes):
+                    shown = shown or len(item) > 0
+                elif not isinstance(item, (int, float)):
+                    raise PDFSyntaxError("TJ array element is not a string "
+                                         "or number")
+            return _infinite if shown else None
+        fs = gs.font_size
+        th = gs.hscale / 100
+
+        # The horizontal advance for each glyph is w0*fs + Tc + Tw,
+        # where w0 is between 0 and the largest advance, and Tw applies
+        # only to some glyphs.  Compute an interval for it.
+        w = font.max_advance * fs
+        lo = (min(0, w) + gs.char_spacing + min(0, gs.word_spacing)) * th
+        hi = (max(0, w) + gs.char_spacing + max(0, gs.word_spacing)) * th
+        lo, hi = min(lo, hi), max(lo, hi)
+
+        plo, phi = text['pen']
+        omin = _inf
+        omax = -_inf
+        for item in items:
+            if isinstance(item, bytes):
+                # Every glyph is at least one byte long, so there are
+                # between 1 and n of them; glyph origins are at most
+                # n-1 advances past the pen, and the pen moves by
+                # between 1 and n advances.
+                n = len(item)
+                if n == 0: continue
+                omin = min(omin, plo + min(0, (n-1) * lo))
+                omax = max(omax, phi + max(0, (n-1) * hi))
+                plo += min(lo, n * lo)
+                phi += max(hi, n * hi)
+            elif isinstance(item, (int, float)):
+                shift = -item / 1000 * fs * th
+                plo += shift
+                phi += shift
+            else:
+                raise PDFSyntaxError("TJ array element is not a string "
+                                     "or number")
+        text['pen'] = (plo, phi)
+        if omin > omax:
+            return None
+
+        g = font.bbox
+        gx = (g[0] * fs * th, g[2] * fs * th)
+        gy = (g[1] * fs + gs.rise, g[3] * fs + gs.rise)
+        bbox = (omin + min(gx), min(gy), omax + max(gx), max(gy))
+        return _transform_rect(text['tlm'], bbox)
+
+    def _end_text(self, et_objs=None):
+        text = self._text
+        self._text = None
+        if text['pending'] is not None:
+            text['removed'].append(text['pending'][1:3])
+        self._removed.extend(text['removed'])
+
+        if text['kept_shows'] > 0 or et_objs is None:
+            for objs, kind in text['objs']:
+                if objs == 'replace':
+                    self._kept.extend(o for r in kind for o in r[0])
+                else:
+                    self._kept.extend(objs)
+            if et_objs is not None:
+                self._kept.extend(et_objs)
+            return
+
+        # Nothing in this text object is visible; strip it down to the
+        # state changes it makes.
+        gone = []
+        for objs, kind in text['objs']:
+            if objs == 'replace':
+                for robjs, rop in kind:
+                    if rop in _text_position: gone.extend(robjs)
+                    else: self._kept.extend(robjs)
+            elif kind in _text_position or kind is _BT:
+                gone.extend(objs)
+                if kind == b'TD':
+                    self._kept.extend([-objs[1], _TL])
+            else:
+                self._kept.extend(objs)
+        if et_objs is not None:
+            gone.extend(et_objs)
+        self._removed.append(('no-paint', gone))
@@ -0,0 +1,188 @@
+# Copyright 2010-2013 Zack Weinberg <zackw@panix.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the Artistic License 2.0.  See the file
+# "Artistic-2.0" in the source distribution, or
+# <http://www.opensource.org/licenses/artistic-license-2.0.php>, for
+# further details.
+
+# Test suite for pdfcache.
+
+import pdfcache
+import pdfcontent
+import unittest
+
+import os
+import random
+import shutil
+import tempfile
+
+rng = random.Random()
+
+Name = pdfcontent.Name
+Operator = pdfcontent.Operator
+
+def parse(data):
+    return list(pdfcontent.ContentParser(bytes((c,)) for c in data))
+
+def frame(body):
+    """Wrap BODY, a sequence of tagged values with an empty table,
+    as a well-formed cache entry."""
+    data = (pdfcache._magic +
+            bytes((pdfcache._version, pdfcontent.PARSER_VERSION, 0)) + body)
+    return data + pdfcache._digest(data)
+
+bad_dict_key = frame(bytes((pdfcache._DICT, pdfcache._ARRAY, pdfcache._END,
+                            pdfcache._NULL, pdfcache._END)))
+
+sample = (b'q 1 0 0 1 72 700 cm BT /F1 12 Tf (Hello \\(world\\)) Tj '
+          b'[(A) -120 (B) 3.25] TJ ET .5 0 0 rg 10 10 m 20.75 -30 l h f '
+          b'/P << /MCID 3 /Alt (x) /Sub << /K [1 2] >> >> BDC EMC '
+          b'/F1 F1 { 1 add } true false null Q')
+
+class t_encoding(unittest.TestCase):
+    def assertIdentical(self, a, b):
+        """Like assertEqual, but also insist on the same types and,
+        for Ids, the very same objects."""
+        self.assertIs(type(a), type(b))
+        if isinstance(a, pdfcontent.Id):
+            self.assertIs(a, b)
+        elif isinstance(a, dict):
+            self.assertEqual(list(a.keys()), list(b.keys()))
+            for k in a:
+                self.assertIdentical(a[k], b[k])
+        elif isinstance(a, list):
+            self.assertEqual(len(a), len(b))
+            for x, y in zip(a, b):
+                self.assertIdentical(x, y)
+        else:
+            self.assertEqual(a, b)
+
+    def test_roundtrip(self):
+        objs = parse(sample)
+        self.assertIdentical(pdfcache.load(pdfcache.dump(objs)), objs)
+
+    def test_name_operator_distinct(self):
+        objs = [Name(b'F1'), Operator(b'F1')]
+        self.assertIdentical(pdfcache.load(pdfcache.dump(objs)), objs)
+
+    def test_numbers(self):
+        objs = [0, 1, -1, 63, 64, -64, -65, 127, 128, 2**63, -2**63, 2**200,
+                0.0, -0.0, .1, 1e300, -2.5]
+        for i in range(1000):
+            objs.append(rng.randint(-2**40, 2**40))
+            objs.append(rng.uniform(-1e6, 1e6))
+        self.assertIdentical(pdfcache.load(pdfcache.dump(objs)), objs)
+
+    def test_empty(self):
+        self.assertEqual(pdfcache.load(pdfcache.dump([])), [])
+        objs = [pdfcontent.Array(), pdfcontent.Dict(), b'']
+        self.assertIdentical(pdfcache.load(pdfcache.dump(objs)), objs)
+
+    def test_unencodable(self):
+        with self.assertRaises(TypeError):
+            pdfcache.dump([object()])
+
+    def test_corrupt(self):
+        data = pdfcache.dump(parse(sample))
+        cases = [b'', b'PDFc', b'XXXX' + data[4:],
+                 data[:4] + b'\x63' + data[5:],
+                 data + b'\xff', data + bytes((pdfcache._ARRAY,)),
+                 bad_dict_key,
+                 frame(bytes((pdfcache._ARRAY,))),
+                 frame(bytes((pdfcache._END,))),
+                 frame(bytes((pdfcache._FLOAT, 0, 0))),
+                 frame(bytes((pdfcache._ID, 0))),
+                 frame(bytes((99,)))]
+        # Every truncation, including those between two top-level
+        # objects, and every single-byte change must be caught.
+        cases.extend(data[:i] for i in range(len(data)))
+        for i in range(len(data)):
+            cases.append(data[:i] + bytes((data[i] ^ 0x10,)) + data[i+1:])
+        for c in cases:
+            with self.assertRaises(pdfcache.CacheError):
+                pdfcache.load(c)
+
+    def test_parser_version(self):
+        data = pdfcache.dump(parse(sample))
+        saved = pdfcontent.PARSER_VERSION
+        try:
+            pdfcache.PARSER_VERSION = saved + 1
+            with self.assertRaises(pdfcache.CacheError):
+                pdfcache.load(data)
+            self.assertEqual(pdfcache.load(pdfcache.dump(parse(sample))),
+                             parse(sample))
+        finally:
+            pdfcache.PARSER_VERSION = saved
+
+class t_ContentCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def entries(self):
+        return sorted(f for f in os.listdir(self.dir)
+                      if f.endswith(pdfcache.ContentCache.suffix))
+
+    def test_hit_and_miss(self):
+        cache = pdfcache.ContentCache(self.dir)
+        objs = cache.parse(sample)
+        self.assertEqual(objs, parse(sample))
+        self.assertEqual(len(self.entries()), 1)
+        self.assertEqual(cache.parse(sample), objs)
+        self.assertEqual(len(self.entries()), 1)
+        cache.parse(b'0 0 m')
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_corrupt_entry(self):
+        cache = pdfcache.ContentCache(self.dir)
+        for damage in (b'PDFc\x01\x00\x07', frame(b'\x07'),
+                       bad_dict_key):
+            with open(cache.path(sample), 'wb') as f:
+                f.write(damage)
+            self.assertEqual(cache.parse(sample), parse(sample))
+        with open(cache.path(sample), 'rb') as f:
+            self.assertEqual(pdfcache.load(f.read()), parse(sample))
+
+    def test_eviction(self):
+        streams = [bytes('{} 0 m'.format(i), 'ascii') for i in range(100)]
+        size = max(len(pdfcache.dump(parse(s))) for s in streams)
+        cache = pdfcache.ContentCache(self.dir, max_size=size * 40)
+        scans = []
+        evict = cache.evict
+        def counting_evict():
+            scans.append(1)
+            evict()
+        cache.evict = counting_evict
+        for i, s in enumerate(streams):
+            cache.parse(s)
+            # Make the modification times distinct.
+            os.utime(cache.path(s), (i, i))
+            total = sum(os.path.getsize(os.path.join(self.dir, f))
+                        for f in self.entries())
+            self.assertLessEqual(total, cache.max_size)
+            self.assertEqual(total, cache.size)
+
+        # The survivors are the most recently used, and the directory
+        # was not rescanned for every store.
+        names = [os.path.basename(cache.path(s)) for s in streams]
+        kept = self.entries()
+        self.assertEqual(sorted(names[-len(kept):]), kept)
+        self.assertLess(len(scans), 20)
+
+    def test_stale_tmp(self):
+        stale = os.path.join(self.dir, 'x.tmp')
+        fresh = os.path.join(self.dir, 'y.tmp')
+        for path in (stale, fresh):
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+        os.utime(stale, (0, 0))
+        cache = pdfcache.ContentCache(self.dir)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertEqual(cache.size, 100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -237,5 +237,49 @@ class t_OpName(unittest.TestCase):
         self.assertIsNot(oa, na)
         self.assertIsNot(ob, nb)
 
+class t_ContentParser(unittest.TestCase):
+    def parse(self, data):
+        return list(pdfcontent.ContentParser(bytes((c,)) for c in data))
+
+    def test_strings(self):
+        cases = { b'(abc)': b'abc',
+                  b'()': b'',
+                  b'(a (nested) string)': b'a (nested) string',
+                  b'(\\(\\)\\\\)': b'()\\',
+                  b'(\\n\\r\\t\\b\\f)': b'\n\r\t\b\f',
+                  b'(a\\\nb)': b'ab',
+                  b'(a\r\nb)': b'a\nb' }
+        for inp, out in cases.items():
+            self.assertEqual(self.parse(inp), [out])
+
+    def test_octal_escapes(self):
+        cases = { b'(\\101)': b'A',
+                  b'(\\0)': b'\x00',
+                  b'(\\12)': b'\n',
+                  b'(\\1012)': b'A2',
+                  b'(\\377\\000)': b'\xff\x00',
+                  b'(\\53x)': b'+x' }
+        for inp, out in cases.items():
+            result = self.parse(inp)
+            self.assertEqual(result, [out])
+            self.assertIsInstance(result[0], bytes)
+
+    def test_arrays(self):
+        result = self.parse(b'[1 2.5 /N (s) [op] ] { 1 add }')
+        self.assertEqual(result,
+                         [[1, 2.5, pdfcontent.Name(b'N'), b's',
+                           [pdfcontent.Operator(b'op')]],
+                          [1, pdfcontent.Operator(b'add')]])
+        self.assertIsInstance(result[0], pdfcontent.Array)
+        self.assertIsInstance(result[0][4], pdfcontent.Array)
+        self.assertIsInstance(result[1], pdfcontent.CArray)
+        self.assertIs(result[0][2], pdfcontent.Name(b'N'))
+        self.assertEqual(self.parse(b'[]'), [[]])
+
+    def test_array_errors(self):
+        for data in (b'[1 2', b'[1 }', b'{1 ]', b'[1 >> ]'):
+            with self.assertRaises(pdfcontent.PDFSyntaxError):
+                self.parse(data)
+
 if __name__ == '__main__':
     unittest.main()
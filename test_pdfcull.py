@@ -0,0 +1,214 @@
+# Copyright 2010-2013 Zack Weinberg <zackw@panix.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the Artistic License 2.0.  See the file
+# "Artistic-2.0" in the source distribution, or
+# <http://www.opensource.org/licenses/artistic-license-2.0.php>, for
+# further details.
+
+# Test suite for pdfcull.
+
+import pdfcontent
+import pdfcull
+import unittest
+
+Name = pdfcontent.Name
+Operator = pdfcontent.Operator
+
+def parse(data):
+    return list(pdfcontent.ContentParser(bytes((c,)) for c in data))
+
+letter = (0, 0, 612, 792)
+
+class t_Culler(unittest.TestCase):
+    def cull(self, data, **kwargs):
+        return pdfcull.Culler(letter, **kwargs).cull(parse(data))
+
+    def assertCulled(self, data, rules, kept, **kwargs):
+        k, r = self.cull(data, **kwargs)
+        self.assertEqual([rule for rule, objs in r], rules)
+        self.assertEqual(k, parse(kept))
+
+    def test_visible(self):
+        data = b'0 0 1 rg 10 10 100 100 re f 1 w 0 0 m 612 792 l S'
+        self.assertCulled(data, [], data)
+
+    def test_outside_page(self):
+        self.assertCulled(b'700 10 50 50 re f 10 10 50 50 re f',
+                          ['outside-page'], b'10 10 50 50 re f')
+        self.assertCulled(b'q 1 0 0 1 0 -1000 cm 10 10 50 50 re f Q',
+                          ['outside-page'], b'q 1 0 0 1 0 -1000 cm Q')
+
+    def test_cropbox(self):
+        data = b'10 10 50 50 re f'
+        k, r = pdfcull.Culler(letter, cropbox=(100, 100, 500, 700)) \
+                      .cull(parse(data))
+        self.assertEqual(r, [('outside-page', parse(data))])
+        self.assertEqual(k, [])
+
+    def test_touching_is_visible(self):
+        self.assertCulled(b'-10 -10 10 10 re f', [], b'-10 -10 10 10 re f')
+
+    def test_stroke_width(self):
+        # The stroke spills over onto the page.
+        self.assertCulled(b'20 w -5 10 m -5 100 l S',
+                          [], b'20 w -5 10 m -5 100 l S')
+        self.assertCulled(b'1 w -10 10 m -10 100 l S',
+                          ['outside-page'], b'1 w')
+
+    def test_clip(self):
+        self.assertCulled(b'q 0 0 100 100 re W n 200 200 50 50 re f Q '
+                          b'200 200 50 50 re f',
+                          ['clipped-out'],
+                          b'q 0 0 100 100 re W n Q 200 200 50 50 re f')
+        self.assertCulled(b'q 0 0 10 10 re W n 20 20 10 10 re W n '
+                          b'0 0 612 792 re f /Im0 Do sh Q',
+                          ['empty-clip', 'empty-clip', 'empty-clip'],
+                          b'q 0 0 10 10 re W n 20 20 10 10 re W n Q')
+
+    def test_zero_area(self):
+        self.assertCulled(b'10 10 0 50 re f 10 10 m 20 20 l 30 30 l h f '
+                          b'10 10 m 20 20 l 30 30 l S',
+                          ['zero-area', 'zero-area'],
+                          b'10 10 m 20 20 l 30 30 l S')
+        self.assertCulled(b'10 10 m 20 20 30 10 40 40 c f',
+                          [], b'10 10 m 20 20 30 10 40 40 c f')
+
+    def test_no_paint(self):
+        self.assertCulled(b'10 10 50 50 re n f q 10 10 50 50 re W n Q',
+                          ['no-paint', 'no-paint'],
+                          b'q 10 10 50 50 re W n Q')
+        # The W must stay paired with its n, or it would clip the
+        # next path instead.
+        self.assertCulled(b'W n 0 0 10 10 re f', [], b'W n 0 0 10 10 re f')
+        self.assertCulled(b'W* f n', ['no-paint'], b'W* f')
+
+    def test_white_on_white(self):
+        self.assertCulled(b'1 g 10 10 50 50 re f 0 0 0 0 k 10 10 50 50 re f '
+                          b'/DeviceRGB cs 1 1 1 sc 10 10 50 50 re f',
+                          ['white-on-white'] * 3,
+                          b'1 g 0 0 0 0 k /DeviceRGB cs 1 1 1 sc')
+        # White over something already painted does change pixels.
+        self.assertCulled(b'0 g 10 10 50 50 re f 1 g 40 40 50 50 re f '
+                          b'200 200 10 10 re f',
+                          ['white-on-white'],
+                          b'0 g 10 10 50 50 re f 1 g 40 40 50 50 re f')
+        # Neither does white in an unknown graphics state.
+        self.assertCulled(b'/GS0 gs 1 g 10 10 50 50 re f',
+                          [], b'/GS0 gs 1 g 10 10 50 50 re f')
+        self.assertCulled(b'1 g 0 G 10 10 50 50 re B',
+                          [], b'1 g 0 G 10 10 50 50 re B')
+
+    def test_white_on_white_scale(self):
+        # Table cells with white backgrounds and small black marks.
+        # The work per object must not grow with the number of objects
+        # painted before it.
+        def comparisons(n):
+            cells = []
+            for i in range(n):
+                x = (i % 100) * 6
+                y = (i // 100) * 6
+                cells.append('1 g {0} {1} 5 .05 re f 0 g {0} {1} 1 .01 re f'
+                             .format(x, y))
+            objs = parse(' '.join(cells).encode('ascii'))
+            count = [0]
+            intersect = pdfcull._intersect
+            def counting_intersect(r, s):
+                count[0] += 1
+                return intersect(r, s)
+            pdfcull._intersect = counting_intersect
+            try:
+                k, r = pdfcull.Culler(letter).cull(objs)
+            finally:
+                pdfcull._intersect = intersect
+            # Crowded buckets are merged, so a few white cells next
+            # to marks are kept; that is conservative, not wrong.
+            self.assertGreater(len(r), n * 9 // 10)
+            return count[0]
+        self.assertLess(comparisons(4000), 5 * comparisons(1000))
+
+    def test_xobjects(self):
+        xobjects = { Name(b'Im0'): pdfcull.UNIT_SQUARE,
+                     Name(b'Fm0'): (0, 0, 100, 100) }
+        self.assertCulled(b'q 10 0 0 10 -20 -20 cm /Im0 Do Q '
+                          b'q 1 0 0 1 600 0 cm /Fm0 Do /Fm1 Do Q',
+                          ['outside-page'],
+                          b'q 10 0 0 10 -20 -20 cm Q '
+                          b'q 1 0 0 1 600 0 cm /Fm0 Do /Fm1 Do Q',
+                          xobjects=xobjects)
+
+    def test_invisible_text(self):
+        data = b'BT /F1 12 Tf 3 Tr 72 700 Td (hidden) Tj ET'
+        # Kept by default, since it is probably an OCR layer.
+        self.assertCulled(data, [], data)
+        self.assertCulled(data, ['invisible-text', 'no-paint'],
+                          b'/F1 12 Tf 3 Tr', drop_invisible_text=True)
+
+    def test_text_outside_page(self):
+        default = pdfcull.DEFAULT_FONT
+        # Culling "b" would move "c" and is not allowed.
+        self.assertCulled(b'BT /F1 12 Tf 72 700 Td (a) Tj '
+                          b'-1000 0 Td (b) Tj (c) Tj ET',
+                          ['outside-page'],
+                          b'BT /F1 12 Tf 72 700 Td (a) Tj '
+                          b'-1000 0 Td (b) Tj ET',
+                          default_font=default)
+        self.assertCulled(b'BT /F1 12 Tf 14 TL 72 2000 Td (a) Tj '
+                          b'(b) \' 10 2 (c) " ET',
+                          ['outside-page'] * 3 + ['no-paint'],
+                          b'/F1 12 Tf 14 TL 10 Tw 2 Tc',
+                          default_font=default)
+        self.assertCulled(b'BT /F1 12 Tf 1000 10 TD (a) Tj ET',
+                          ['outside-page', 'no-paint'],
+                          b'/F1 12 Tf -10 TL',
+                          default_font=default)
+
+    def test_text_unknown_font(self):
+        # Without metrics, text could be anywhere.
+        data = b'BT /F1 12 Tf -1000 -1000 Td (a) Tj [(b) 5 (c)] TJ ET'
+        self.assertCulled(data, [], data)
+        self.assertCulled(b'q 0 0 1 1 re W n 5 5 1 1 re W n '
+                          b'BT /F1 12 Tf (a) Tj ET Q',
+                          ['empty-clip', 'no-paint'],
+                          b'q 0 0 1 1 re W n 5 5 1 1 re W n /F1 12 Tf Q')
+
+    def test_text_metrics(self):
+        data = b'BT /F1 10 Tf 1 0 0 1 -25 100 Tm (abc) Tj ET'
+        self.assertCulled(data, [], data)
+        fonts = { Name(b'F1'): pdfcull.FontMetrics((0, -.2, .6, .8), .6) }
+        self.assertCulled(data, ['outside-page', 'no-paint'], b'/F1 10 Tf',
+                          fonts=fonts)
+        # A negative TJ adjustment can bring it back onto the page.
+        data = b'BT /F1 10 Tf 1 0 0 1 -25 100 Tm [(ab) -1000 (c)] TJ ET'
+        self.assertCulled(data, [], data, fonts=fonts)
+
+    def test_text_multibyte(self):
+        # With two-byte codes, the first show advances the pen by only
+        # two glyphs, leaving the second show on the page.
+        fonts = { Name(b'F'): pdfcull.FontMetrics((0, 0, 1, 1), 1) }
+        data = (b'BT /F 10 Tf 20 Tc 0 50 Td (\\000\\001\\000\\002) Tj '
+                b'(\\000\\003) Tj ET')
+        k, r = pdfcull.Culler((0, 0, 65, 100), fonts=fonts) \
+                      .cull(parse(data))
+        self.assertEqual(r, [])
+        self.assertEqual(k, parse(data))
+
+    def test_text_unterminated(self):
+        data = b'BT /F1 12 Tf 72 700 Td (a) Tj BT (b) Tj ET'
+        self.assertCulled(data, [], data)
+        data = b'BT /F1 12 Tf 72 700 Td (a) Tj'
+        self.assertCulled(data, [], data)
+
+    def test_text_clip_mode(self):
+        data = b'BT /F1 12 Tf 7 Tr -1000 0 Td (a) Tj ET'
+        self.assertCulled(data, [], data)
+
+    def test_errors(self):
+        culler = pdfcull.Culler(letter)
+        for data in (b'1 2 3 re f', b'1 2 l S', b'0 0 1 cm',
+                     b'BT (a) Tj ET', b'1 2'):
+            with self.assertRaises(pdfcontent.PDFSyntaxError):
+                culler.cull(parse(data))
+
+if __name__ == '__main__':
+    unittest.main()